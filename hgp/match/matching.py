@@ -16,23 +16,23 @@ ranked the other.
 """
 
 import csv
+import heapq
 import random
+import sys
 
-from collections import Counter, defaultdict
+from collections import Counter
 from dataclasses import dataclass
-from typing import cast, Dict, Iterable, List, Mapping, Set, Tuple, Union
-
-from fuzzywuzzy import process  # type: ignore
-from matching.games.hospital_resident import HospitalResident  # type: ignore
+from typing import (cast, Collection, Dict, Iterable, List, Mapping, Optional,
+                    Set, Tuple, Union)
 
 
 class InvalidProblemStatement(Exception):
     """The exception raised when a problem formulation is invalid.
     """
 
-TRawMatrix = List[List[str]]
+TRawMatrix = Iterable[List[str]]
 TRawMatchDict = Mapping[str, Union[Tuple[int, List[str]], List[str]]]
-TRawCapacity = List[Tuple[str, Union[str, int]]]
+TRawCapacity = Iterable[Tuple[str, Union[str, int]]]
 TRankingDict = Dict[str, List[str]]
 TCapacity = Dict[str, int]
 TMatching = Dict[str, List[str]]
@@ -46,15 +46,9 @@ def _throw_with_line(file, idx, msg):
 def _all_players(mentee_rankings: TRankingDict,
                  mentor_rankings: TRankingDict,
                  mentor_capacities: TCapacity):
-    all_mentees = set(mentee_rankings.keys())
-    all_mentors = set(mentor_rankings.keys())
-    all_mentors |= set(mentor_capacities.keys())
-
-    for rankings in mentee_rankings.values():
-        all_mentors.update(rankings)
-
-    for rankings in mentor_rankings.values():
-        all_mentees.update(rankings)
+    all_mentees = set(mentee_rankings).union(*mentor_rankings.values())
+    all_mentors = set(mentor_rankings).union(mentor_capacities,
+                                             *mentee_rankings.values())
 
     return all_mentees, all_mentors
 
@@ -63,7 +57,9 @@ def _ranking_dict(rankings: TRawMatchDict) -> TRankingDict:
     return {k: v[1] if isinstance(v, tuple) else v for k, v in rankings.items()}
 
 
-def _duplicates(values: Iterable[str]) -> List[str]:
+def _duplicates(values: Collection[str]) -> List[str]:
+    if len(values) == len(set(values)):
+        return []
     return [item for item, count in Counter(values).items() if count > 1]
 
 
@@ -99,13 +95,19 @@ def validate_rankings(mentee_rankings: TRawMatchDict,
         If the ranking is invalid
     """
     def closest_match(value: str, candidates: Iterable[str]) -> str:
-        maybe_match = process.extractOne(value.lower(),
-                                         list(x.lower() for x in candidates),
+        # Only needed to build error messages, so rapidfuzz is imported lazily
+        # to keep it off the startup path of successful runs
+        # pylint: disable=import-outside-toplevel
+        from rapidfuzz import fuzz, process
+
+        # Keyed by the original name so that the match resolves back to it
+        # without a scan, even if two candidates differ only by case
+        normalized = {candidate: candidate.lower() for candidate in candidates}
+        maybe_match = process.extractOne(value.lower(), normalized,
+                                         scorer=fuzz.WRatio,
                                          score_cutoff=50)
         if maybe_match:
-            for candidate in candidates:
-                if candidate.lower() == maybe_match[0]:
-                    return candidate
+            return maybe_match[2]
         return 'UNKNOWN'  # pragma: no cover
 
     def raise_on_duplicates(player, player_type, values):
@@ -117,10 +119,14 @@ def validate_rankings(mentee_rankings: TRawMatchDict,
 
     def validate_mentees(mentee_rankings: TRankingDict,
                          mentors: Set[str]):
+        missing = set().union(*mentee_rankings.values()) - mentors
         for mentee, rankings in mentee_rankings.items():
             raise_on_duplicates('Mentee', mentee, rankings)
+            if not missing:
+                continue
+
             for mentee_ranking in rankings:
-                if not mentee_ranking in mentors:
+                if mentee_ranking in missing:
                     candidate = closest_match(mentee_ranking, mentors)
                     raise InvalidProblemStatement(f"Mentee {mentee} ranked a "
                                                   f"mentor {mentee_ranking} "
@@ -131,6 +137,7 @@ def validate_rankings(mentee_rankings: TRawMatchDict,
     def validate_mentors(mentor_rankings: TRankingDict,
                          mentor_capacities: TCapacity,
                          mentees: Set[str]):
+        missing = set().union(*mentor_rankings.values()) - mentees
         for mentor, rankings in mentor_rankings.items():
             raise_on_duplicates('Mentor', mentor, rankings)
 
@@ -139,8 +146,11 @@ def validate_rankings(mentee_rankings: TRawMatchDict,
                       "capacities file"
                 raise InvalidProblemStatement(msg)
 
+            if not missing:
+                continue
+
             for mentor_ranking in rankings:
-                if not mentor_ranking in mentees:
+                if mentor_ranking in missing:
                     candidate = closest_match(mentor_ranking, mentees)
                     msg = f"Mentor {mentor} ranked a mentee {mentor_ranking} " \
                           'that does not exist. The closest candidate is ' \
@@ -191,6 +201,18 @@ class MatchStatement:
         self.mentor_capacities = mentor_capacities
 
 
+def _prevalidated_statement(mentee_rankings: TRankingDict,
+                            mentor_rankings: TRankingDict,
+                            mentor_capacities: TCapacity) -> MatchStatement:
+    # Builds a MatchStatement from inputs that are already known to be valid,
+    # skipping the validation done by MatchStatement.__init__
+    statement = MatchStatement.__new__(MatchStatement)
+    statement.mentee_rankings = mentee_rankings
+    statement.mentor_rankings = mentor_rankings
+    statement.mentor_capacities = mentor_capacities
+    return statement
+
+
 def validate_and_transform(mentee_rankings: TRawMatrix,
                            mentor_rankings: TRawMatrix,
                            mentor_capacities: TRawCapacity) -> MatchStatement:
@@ -208,6 +230,9 @@ def validate_and_transform(mentee_rankings: TRawMatrix,
     matrix. The first column of each row is the name of the mentor. The second
     is their mentee capacity.
 
+    Each matrix is consumed in a single pass, so any iterable of rows (e.g., a
+    :code:`csv.reader`) can be passed in place of a list.
+
     Attributes
     ----------
     mentee_rankings
@@ -236,6 +261,7 @@ def validate_and_transform(mentee_rankings: TRawMatrix,
                                  'have two columns')
 
             mentor, capacity = mentor_capacity
+            mentor = sys.intern(mentor)
             if mentor in mentors:
                 _throw_with_line('mentor_capacities', idx,
                                  'The same mentor appears twice in the mentor '
@@ -266,11 +292,16 @@ def validate_and_transform(mentee_rankings: TRawMatrix,
                 _throw_with_line(f"{ranking_type}_ranking",
                                  idx, f"duplicate in {ranking_type} rows")
 
-            if len(ranking[1:]) != len(set(ranking[1:])):
+            ranked = ranking[1:]
+            if len(ranked) != len(set(ranked)):
                 _throw_with_line(f"{ranking_type}_ranking",
                                  idx, f"duplicate in {ranking_type} columns")
 
-            rankings_processed[ranking[0]] = (idx, ranking[1:])
+            # Interning makes the same name share one object across all three
+            # inputs, so the many downstream dict/set lookups compare by
+            # identity
+            rankings_processed[sys.intern(ranking[0])] = \
+                (idx, [sys.intern(x) for x in ranked])
 
         return rankings_processed
 
@@ -288,12 +319,13 @@ def validate_and_transform(mentee_rankings: TRawMatrix,
                                       'mentee capacity for one or more '
                                       'mentors.')
 
-    return MatchStatement(_ranking_dict(mentee_preprocessed),
-                          _ranking_dict(mentor_preprocessed),
-                          mentor_capacities_processed)
+    return _prevalidated_statement(_ranking_dict(mentee_preprocessed),
+                                   _ranking_dict(mentor_preprocessed),
+                                   mentor_capacities_processed)
 
 
-def poset_to_ordered(statement: MatchStatement) -> MatchStatement:
+def poset_to_ordered(statement: MatchStatement,
+                     rng: Optional[random.Random] = None) -> MatchStatement:
     """
     Expands a partial ordering wherein mentees have not necessarily ranked
     every mentor (and vice versa) into a total order. The expansion is done
@@ -305,22 +337,28 @@ def poset_to_ordered(statement: MatchStatement) -> MatchStatement:
     ----------
     statement
         A match statement that need not contain a total ordering.
+    rng
+        The random number generator used to break ties between unranked
+        players. Expansions are reproducible for a given generator state;
+        a fresh :code:`random.Random()` is used if omitted.
 
     Returns
     -------
     match_statement
         A :class:`MatchStatement` formulated from the given inputs
     """
+    def ranked_by(rankings: TRankingDict) -> TRankingDict:
+        inverted: TRankingDict = {}
+        for player, player_rankings in rankings.items():
+            for ranking in player_rankings:
+                inverted.setdefault(ranking, []).append(player)
+        return inverted
+
     def make_total_ordering(player_rankings: TRankingDict,
-                            opponent_rankings: TRankingDict,
-                            all_players: Set[str],
-                            all_opponents: Set[str]) -> TRankingDict:
+                            opponents_ranking_player: TRankingDict,
+                            all_players: List[str],
+                            all_opponents: List[str]) -> TRankingDict:
         transformed: TRankingDict = dict()
-        opponents_ranking_player = defaultdict(set)
-
-        for opponent_name, opponent_ranking in opponent_rankings.items():
-            for ranking in opponent_ranking:
-                opponents_ranking_player[ranking].add(opponent_name)
 
         player_rankings = player_rankings.copy()
         for player in all_players:
@@ -328,32 +366,44 @@ def poset_to_ordered(statement: MatchStatement) -> MatchStatement:
                 player_rankings[player] = list()
 
         for player, rankings in player_rankings.items():
-            opponent_ranked = list(opponents_ranking_player[player])
-            unranked = list(all_opponents -
-                            (set(rankings) | set(opponent_ranked)))
-            random.shuffle(opponent_ranked)
-            random.shuffle(unranked)
-            total_ordering = list(rankings) + \
-                [x for x in opponent_ranked
-                 if x not in set(rankings)] + unranked
-
+            ranked = set(rankings)
+            opponent_ranked = opponents_ranking_player.get(player, [])
+            opponent_only = [x for x in opponent_ranked if x not in ranked]
+            excluded = ranked.union(opponent_ranked)
+            unranked = [x for x in all_opponents if x not in excluded]
+            shuffle(opponent_only)
+            shuffle(unranked)
+
+            total_ordering = list(rankings)
+            total_ordering.extend(opponent_only)
+            total_ordering.extend(unranked)
             transformed[player] = total_ordering
 
         return transformed
 
-    all_mentees, all_mentors = _all_players(statement.mentee_rankings,
-                                            statement.mentor_rankings,
-                                            statement.mentor_capacities)
+    shuffle = (rng or random.Random()).shuffle
+
+    # Sorted so that iteration order, and therefore the outcome for a given
+    # generator state, doesn't depend on string hash randomization
+    all_mentees, all_mentors = map(sorted,
+                                   _all_players(statement.mentee_rankings,
+                                                statement.mentor_rankings,
+                                                statement.mentor_capacities))
+    mentee_ranked_by = ranked_by(statement.mentor_rankings)
+    mentor_ranked_by = ranked_by(statement.mentee_rankings)
 
-    return MatchStatement(make_total_ordering(statement.mentee_rankings,
-                                              statement.mentor_rankings,
-                                              all_mentees,
-                                              all_mentors),
-                          make_total_ordering(statement.mentor_rankings,
-                                              statement.mentee_rankings,
-                                              all_mentors,
-                                              all_mentees),
-                          statement.mentor_capacities.copy())
+    mentee_rankings = make_total_ordering(statement.mentee_rankings,
+                                          mentee_ranked_by,
+                                          all_mentees,
+                                          all_mentors)
+    mentor_rankings = make_total_ordering(statement.mentor_rankings,
+                                          mentor_ranked_by,
+                                          all_mentors,
+                                          all_mentees)
+
+    return _prevalidated_statement(mentee_rankings,
+                                   mentor_rankings,
+                                   statement.mentor_capacities.copy())
 
 
 def from_csv_files(mentee_rankings_path: str,
@@ -413,15 +463,12 @@ def from_csv_files(mentee_rankings_path: str,
     """
     def read_csv(path: str, file_type: str) -> TRawMatrix:
         try:
-            with open(path, 'r') as input_file:
+            with open(path, 'r', newline='') as input_file:
                 csv_reader = csv.reader(input_file, lineterminator='\n')
-                result = list()
                 for row in csv_reader:
-                    col = list(x.strip() for x in row)
-                    if col:
-                        result.append(row)
-
-                return result
+                    row = [x.strip() for x in row]
+                    if any(row):
+                        yield row
         except Exception as e:
             raise InvalidProblemStatement(f"failed to {file_type} file, {e}") \
                 from e
@@ -435,8 +482,131 @@ def from_csv_files(mentee_rankings_path: str,
                                   cast(TRawCapacity, mentor_capacities))
 
 
+def _inverse_ranks(prefs: List[List[int]],
+                   num_opponents: int) -> List[List[int]]:
+    # ranks[player][opponent] is the position of opponent in player's
+    # preferences, or -1 if player didn't rank them
+    ranks = [[-1] * num_opponents for _ in prefs]
+    for player_ranks, player_prefs in zip(ranks, prefs):
+        for rank, opponent in enumerate(player_prefs):
+            player_ranks[opponent] = rank
+    return ranks
+
+
+def _mentee_proposing(mentee_prefs: List[List[int]],
+                      mentor_ranks: List[List[int]],
+                      capacities: List[int]) -> List[List[int]]:
+    # Each mentor's assignees are kept in a max-heap on rank so that the least
+    # preferred mentee can be bumped in O(log capacity)
+    heaps: List[List[Tuple[int, int]]] = [[] for _ in capacities]
+    next_choice = [0] * len(mentee_prefs)
+    free = list(range(len(mentee_prefs)))
+    # Locals avoid repeated global and attribute lookups in the hot loop
+    heappush, heapreplace = heapq.heappush, heapq.heapreplace
+    push = free.append
+    while free:
+        mentee = free.pop()
+        prefs = mentee_prefs[mentee]
+        choice = next_choice[mentee]
+        if choice == len(prefs):
+            continue
+
+        mentor = prefs[choice]
+        next_choice[mentee] = choice + 1
+        rank = mentor_ranks[mentor][mentee]
+        heap = heaps[mentor]
+        if rank < 0:
+            push(mentee)
+        elif len(heap) < capacities[mentor]:
+            heappush(heap, (-rank, mentee))
+        elif rank < -heap[0][0]:
+            push(heapreplace(heap, (-rank, mentee))[1])
+        else:
+            push(mentee)
+
+    return [[mentee for _, mentee in heap] for heap in heaps]
+
+
+def _mentor_proposing(mentor_prefs: List[List[int]],
+                      mentee_ranks: List[List[int]],
+                      capacities: List[int]) -> List[List[int]]:
+    matched_to = [-1] * len(mentee_ranks)
+    num_assigned = [0] * len(mentor_prefs)
+    next_choice = [0] * len(mentor_prefs)
+    undersubscribed = list(range(len(mentor_prefs)))
+    while undersubscribed:
+        mentor = undersubscribed.pop()
+        prefs = mentor_prefs[mentor]
+        choice = next_choice[mentor]
+        while num_assigned[mentor] < capacities[mentor] and \
+                choice < len(prefs):
+            mentee = prefs[choice]
+            choice += 1
+            ranks = mentee_ranks[mentee]
+            rank = ranks[mentor]
+            current = matched_to[mentee]
+            if rank < 0 or (current >= 0 and rank > ranks[current]):
+                continue
+
+            matched_to[mentee] = mentor
+            num_assigned[mentor] += 1
+            if current >= 0:
+                num_assigned[current] -= 1
+                undersubscribed.append(current)
+        next_choice[mentor] = choice
+
+    assigned: List[List[int]] = [[] for _ in mentor_prefs]
+    for mentee, mentor in enumerate(matched_to):
+        if mentor >= 0:
+            assigned[mentor].append(mentee)
+    return assigned
+
+
+def _native_solve(mentee_rankings: TRankingDict,
+                  mentor_rankings: TRankingDict,
+                  mentor_capacities: TCapacity,
+                  mentee_optimal=True) -> TMatching:
+    """
+    Hospital/resident Gale–Shapley over integer ids. A mentee and mentor are
+    only matched if both sides ranked each other.
+    """
+    mentees = list(mentee_rankings)
+    mentors = list(mentor_capacities)
+    mentee_ids = {mentee: idx for idx, mentee in enumerate(mentees)}
+    mentor_ids = {mentor: idx for idx, mentor in enumerate(mentors)}
+
+    mentee_prefs = [[mentor_ids[x] for x in mentee_rankings[mentee]]
+                    for mentee in mentees]
+    mentor_prefs = [[mentee_ids[x] for x in mentor_rankings.get(mentor, [])]
+                    for mentor in mentors]
+    capacities = [mentor_capacities[mentor] for mentor in mentors]
+
+    if mentee_optimal:
+        assigned = _mentee_proposing(mentee_prefs,
+                                     _inverse_ranks(mentor_prefs, len(mentees)),
+                                     capacities)
+    else:
+        assigned = _mentor_proposing(mentor_prefs,
+                                     _inverse_ranks(mentee_prefs, len(mentors)),
+                                     capacities)
+
+    return {mentor: [mentees[x] for x in assigned[idx]]
+            for idx, mentor in enumerate(mentors)}
+
+
+def _solve_poset(poset_problem: MatchStatement,
+                 mentee_optimal: bool,
+                 rng: random.Random) -> TMatching:
+    problem = poset_to_ordered(poset_problem, rng=rng)
+    return _native_solve(problem.mentee_rankings,
+                         problem.mentor_rankings,
+                         problem.mentor_capacities,
+                         mentee_optimal=mentee_optimal)
+
+
 def solve_from_poset_problem(poset_problem: MatchStatement,
-                             mentee_optimal=True) -> TMatching:
+                             mentee_optimal=True,
+                             seed: Optional[int] = None) -> TMatching:
     """
     Finds a stable marriage using the modified Gale–Shapley algorithm, given
     a `class`:MatchStatement that's a total ordering. This ordering can
@@ -451,6 +621,9 @@ def solve_from_poset_problem(poset_problem: MatchStatement,
         Hospital/resident style stable marrage problems are always optimal
         for one side or the other. By default this function optimizes for
         mentee outcomes.
+    seed:
+        An optional seed for the generator passed to :func:`poset_to_ordered`;
+        solutions are reproducible for a given seed.
 
     Returns
     -------
@@ -463,14 +636,40 @@ def solve_from_poset_problem(poset_problem: MatchStatement,
     Exception
         If :code:`poset_problem` isn't a valid total ordering
     """
-    problem = poset_to_ordered(poset_problem)
-    game = HospitalResident.create_from_dictionaries(problem.mentee_rankings,
-                                                     problem.mentor_rankings,
-                                                     problem.mentor_capacities)
+    return _solve_poset(poset_problem, mentee_optimal, random.Random(seed))
+
+
+def solve_from_poset_problems(poset_problems: Iterable[MatchStatement],
+                              mentee_optimal=True,
+                              seed: Optional[int] = None) -> List[TMatching]:
+    """
+    Solves a batch of problems as per :func:`solve_from_poset_problem`. A
+    single random number generator is shared across the batch, so the batch as
+    a whole is reproducible for a given seed.
+
+    Attributes
+    ----------
+    poset_problems:
+        Totally ordered statements of matching problems
+    mentee_optimal:
+        Optimize every matching in favor of mentees (the default) or mentors
+    seed:
+        An optional seed for the generator passed to :func:`poset_to_ordered`
+
+    Returns
+    -------
+    matchings
+        One stable marriage matching per problem, in input order
+
+    Raises
+    ------
+    Exception
+        If any problem isn't a valid total ordering
+    """
+    rng = random.Random(seed)
+    return [_solve_poset(poset_problem, mentee_optimal, rng)
+            for poset_problem in poset_problems]
 
-    matching = game.solve(optimal='resident' if mentee_optimal else 'hospital')
-    return {key.name: [x.name for x in value] for key, value in
-            matching.items()}
 
 def solve(mentee_rankings_path: str,
           mentor_rankings_path: str,
@@ -503,10 +702,20 @@ def solve(mentee_rankings_path: str,
                                    mentor_capacities_path)
     matching = solve_from_poset_problem(poset_problem,
                                         mentee_optimal=mentee_optimal)
+
+    # The matching is private to this call, so its lists are sorted in place
+    mentors = list(matching)
+    mentors.sort()
+    rows = list()
+    for mentor in mentors:
+        mentees = matching[mentor]
+        mentees.sort()
+        rows.append([mentor, *mentees])
+
     try:
-        with open(result_path, 'w', encoding='utf8') as output_file:
+        with open(result_path, 'w', encoding='utf8', newline='',
+                  buffering=1 << 20) as output_file:
             csv_writer = csv.writer(output_file, lineterminator='\n')
-            for mentor in sorted(matching.keys()):
-                csv_writer.writerow([mentor] + sorted(matching[mentor]))
+            csv_writer.writerows(rows)
     except Exception as e:  # pragma: no cover # pylint: disable=bare-except
         raise Exception('Unable to write output; check output path') from e
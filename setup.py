@@ -22,9 +22,7 @@ setuptools.setup(
     ],
     python_requires='>=3.7',
     install_requires=[
-        'matching>=1.3.2,<2',
-        'fuzzywuzzy>=0.18.0,<0.19.0',
-        'python-Levenshtein>=0.12.0,<1.0.0'
+        'rapidfuzz>=2.0'
     ],
     extras_require={
         'dev': [
@@ -34,6 +32,7 @@ setuptools.setup(
             'mypy',
             'autopep8',
             'coveralls',
+            'matching>=1.3.2,<2',
             'pytest',
             'wheel'
         ]
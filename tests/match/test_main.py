@@ -11,7 +11,7 @@ import hgp.match.main as match_main
 import tests.match.util as util
 
 
-class TestVerifyAndTransform(util.TestWithTempDirectory):
+class TestVerifyAndTransform(util.TestWithTempOutput):
     def build_args_for_base_dir(self, base_dir):
         mentee_path, mentor_path, mentor_capacities_path = \
             util.match_inputs(base_dir)
@@ -40,8 +40,10 @@ class TestVerifyAndTransform(util.TestWithTempDirectory):
             match_main.main()
 
             with open(args[-1], 'r') as results_file:
-                match = sorted(list(csv.reader(results_file)))
+                match = sorted(tuple(row) for row in csv.reader(results_file))
                 self.assertEqual(len(match), 2)
+                self.assertEqual(match[0][0], 'M1')
+                self.assertEqual(match[1][0], 'M2')
 
 
 if __name__ == '__main__':
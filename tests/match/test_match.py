@@ -1,9 +1,13 @@
 # pylint: disable=missing-docstring
 
-import csv
+import pathlib
 import random
 import unittest
 
+from typing import Tuple
+
+from matching.games.hospital_resident import HospitalResident  # type: ignore
+
 import hgp.match.matching as matching
 
 import tests.match.util as util
@@ -26,35 +30,76 @@ class TestVerify(unittest.TestCase):
                                        {'M1': ['S1', 'S1']},
                                        {'M1': 1})
 
+    def test_closest_match_restores_capitalisation(self):
+        with self.assertRaisesRegex(matching.InvalidProblemStatement,
+                                    'closest candidate is M1$'):
+            matching.validate_rankings({'S1': ['m1']},
+                                       {},
+                                       {'M1': 1, 'M2': 1})
+
+        with self.assertRaisesRegex(matching.InvalidProblemStatement,
+                                    'closest candidate is S2$'):
+            matching.validate_rankings({'S1': ['M1'], 'S2': ['M1']},
+                                       {'M1': ['s2']},
+                                       {'M1': 1})
 
-class TestVerifyAndTransform(unittest.TestCase):
-    def test_no_capacity_for_mentor(self):
-        with self.assertRaises(matching.InvalidProblemStatement):
-            matching.validate_and_transform([], [], [['a']])
-
-    def test_non_numeric_capacity_for_mentor(self):
-        with self.assertRaises(matching.InvalidProblemStatement):
-            matching.validate_and_transform([], [], [['a', 'b']])
-
-    def test_negative_capacity_for_mentor(self):
-        with self.assertRaises(matching.InvalidProblemStatement):
-            matching.validate_and_transform([], [], [['a', -1]])
-
-    def test_zero_capacity_for_mentor(self):
-        with self.assertRaises(matching.InvalidProblemStatement):
-            matching.validate_and_transform([], [], [['a', 0]])
-
-    def test_too_many_capacity_columns(self):
-        with self.assertRaises(matching.InvalidProblemStatement):
-            matching.validate_and_transform([], [], [['a', 1, 2]])
+    def test_errors_reported_in_player_order(self):
+        with self.assertRaisesRegex(matching.InvalidProblemStatement,
+                                    'Mentee S1 ranked a mentor Mx'):
+            matching.validate_rankings({'S1': ['Mx'], 'S2': ['M1', 'M1']},
+                                       {},
+                                       {'M1': 1})
 
-    def test_duplicate_capacity_columns(self):
-        with self.assertRaises(matching.InvalidProblemStatement):
-            matching.validate_and_transform([], [], [['a', 1], ['a', 1]])
 
-    def test_bad_type_for_capacity_columns(self):
-        with self.assertRaises(matching.InvalidProblemStatement):
-            matching.validate_and_transform([], [], [['a', []]])
+class TestVerifyAndTransform(unittest.TestCase):
+    INVALID_CAPACITIES = {
+        'no_capacity_for_mentor': [['a']],
+        'non_numeric_capacity_for_mentor': [['a', 'b']],
+        'negative_capacity_for_mentor': [['a', -1]],
+        'zero_capacity_for_mentor': [['a', 0]],
+        'too_many_capacity_columns': [['a', 1, 2]],
+        'duplicate_capacity_columns': [['a', 1], ['a', 1]],
+        'bad_type_for_capacity_columns': [['a', []]]
+    }
+
+    INVALID_RANKINGS = {
+        'duplicate_mentee': ([['S1', 'M1'], ['S1', 'M1']],
+                             [['M1', 'S1']],
+                             [['M1', '1']]),
+        'duplicate_mentor': ([['S1', 'M1']],
+                             [['M1', 'S1'], ['M1', 'S1']],
+                             [['M1', '1']]),
+        'duplicate_mentee_ranking': ([['S1', 'M1', 'M1']],
+                                     [['M1', 'S1']],
+                                     [['M1', '1']]),
+        'duplicate_mentor_ranking': ([['S1', 'M1']],
+                                     [['M1', 'S1', 'S1']],
+                                     [['M1', '1']]),
+        'unknown_mentor': ([['S1', 'M2']],
+                           [['M1', 'S1']],
+                           [['M1', '1']]),
+        'unknown_mentor_unranked': ([['S1', 'M2']],
+                                    [],
+                                    [['M1', '1']]),
+        'unknown_mentee': ([['S1', 'M1']],
+                           [['M1', 'S2']],
+                           [['M1', '1']]),
+        'unknown_mentee_unranked': ([],
+                                    [['M1', 'S2']],
+                                    [['M1', '1']]),
+        'missing_capacity_for_ranked_mentor': ([['S1', 'M1']],
+                                               [['M1', 'S1']],
+                                               [['M2', '1']]),
+        'missing_capacity_for_ranking_mentor': ([['S1', 'M1']],
+                                                [['M1', 'S1'], ['M2', 'S1']],
+                                                [['M1', '1']])
+    }
+
+    def test_invalid_capacities(self):
+        for case, capacity in self.INVALID_CAPACITIES.items():
+            with self.subTest(case=case), \
+                    self.assertRaises(matching.InvalidProblemStatement):
+                matching.validate_and_transform([], [], capacity)
 
     def test_string_capacity_columns(self):
         res = matching.validate_and_transform([], [], [['a', '1']])
@@ -64,65 +109,11 @@ class TestVerifyAndTransform(unittest.TestCase):
         res = matching.validate_and_transform([], [], [['a', 1]])
         self.assertDictEqual(res.mentor_capacities, {'a': 1})
 
-    def test_duplicate_mentee(self):
-        with self.assertRaises(matching.InvalidProblemStatement):
-            mentee = [['S1', 'M1'], ['S1', 'M1']]
-            mentor = [['M1', 'S1']]
-            capacity = [['M1', '1']]
-            matching.validate_and_transform(mentee, mentor, capacity)
-
-    def test_duplicate_mentor(self):
-        with self.assertRaises(matching.InvalidProblemStatement):
-            mentee = [['S1', 'M1']]
-            mentor = [['M1', 'S1'], ['M1', 'S1']]
-            capacity = [['M1', '1']]
-            matching.validate_and_transform(mentee, mentor, capacity)
-
-    def test_duplicate_ranking(self):
-        with self.assertRaises(matching.InvalidProblemStatement):
-            mentee = [['S1', 'M1', 'M1']]
-            mentor = [['M1', 'S1']]
-            capacity = [['M1', '1']]
-            matching.validate_and_transform(mentee, mentor, capacity)
-
-        with self.assertRaises(matching.InvalidProblemStatement):
-            mentee = [['S1', 'M1']]
-            mentor = [['M1', 'S1', 'S1']]
-            capacity = [['M1', '1']]
-            matching.validate_and_transform(mentee, mentor, capacity)
-
-    def test_unknown_mentor(self):
-        mentee = [['S1', 'M2']]
-        capacity = [['M1', '1']]
-
-        with self.assertRaises(matching.InvalidProblemStatement):
-            matching.validate_and_transform(mentee, [['M1', 'S1']], capacity)
-
-        with self.assertRaises(matching.InvalidProblemStatement):
-            matching.validate_and_transform(mentee, [], capacity)
-
-    def test_unknown_mentee(self):
-        mentor = [['M1', 'S2']]
-        capacity = [['M1', '1']]
-
-        with self.assertRaises(matching.InvalidProblemStatement):
-            matching.validate_and_transform([['S1', 'M1']], mentor, capacity)
-
-        with self.assertRaises(matching.InvalidProblemStatement):
-            matching.validate_and_transform([], mentor, capacity)
-
-    def test_missing_capacity_for_mentor(self):
-        with self.assertRaises(matching.InvalidProblemStatement):
-            mentee = [['S1', 'M1']]
-            mentor = [['M1', 'S1']]
-            capacity = [['M2', '1']]
-            matching.validate_and_transform(mentee, mentor, capacity)
-
-        with self.assertRaises(matching.InvalidProblemStatement):
-            mentee = [['S1', 'M1']]
-            mentor = [['M1', 'S1'], ['M2', 'S1']]
-            capacity = [['M1', '1']]
-            matching.validate_and_transform(mentee, mentor, capacity)
+    def test_invalid_rankings(self):
+        for case, (mentee, mentor, capacity) in self.INVALID_RANKINGS.items():
+            with self.subTest(case=case), \
+                    self.assertRaises(matching.InvalidProblemStatement):
+                matching.validate_and_transform(mentee, mentor, capacity)
 
     def test_insufficient_mentor_capacity(self):
         with self.assertRaises(matching.InvalidProblemStatement):
@@ -190,89 +181,95 @@ class TestVerifyAndTransform(unittest.TestCase):
         self.assertEqual(sum(len(x) for x in res.values()), 3)
 
     def test_random_instances(self):
-        def ranking_dict(row_name, max_rows, col_name, max_cols):
+        def ranking_dict(row_players, col_players, rng):
             ranking_dict = dict()
-            rows = list(range(max_rows))
-            cols = list(range(max_cols))
-            random.shuffle(rows)
+            rows = rng.sample(row_players, rng.randint(1, len(row_players)))
 
-            for row_player in rows[:random.randint(1, max_rows)]:
-                random.shuffle(cols)
-                rankings = [f"{col_name}{col}" for col in
-                            cols[:random.randint(1, max_cols)]]
-                ranking_dict[f"{row_name}{row_player}"] = rankings
+            for row_player in rows:
+                ranking_dict[row_player] = \
+                    rng.sample(col_players, rng.randint(1, len(col_players)))
 
             return ranking_dict
 
-        def generate_problem(max_mentees, max_mentors):
-            mentee_ranks = ranking_dict('S', max_mentees, 'M', max_mentors)
-            mentor_ranks = ranking_dict('M', max_mentors, 'S', max_mentees)
-            mentor_ranks = {k: [x for x in v if x in set(mentee_ranks.keys())]
+        def generate_problem(mentees, mentors, rng):
+            mentee_ranks = ranking_dict(mentees, mentors, rng)
+            mentor_ranks = ranking_dict(mentors, mentees, rng)
+            mentee_keys = mentee_ranks.keys()
+            mentor_ranks = {k: [x for x in v if x in mentee_keys]
                             for k, v in mentor_ranks.items()}
             all_mentors = set(mentor_ranks.keys())
             for ranks in mentee_ranks.values():
                 all_mentors.update(ranks)
 
-            mentor_capacity = dict(zip(all_mentors,
-                                       (random.randint(1, 5) for _ in
+            mentor_capacity = dict(zip(sorted(all_mentors),
+                                       (rng.randint(1, 5) for _ in
                                         range(len(all_mentors)))))
 
-            while sum(mentor_capacity.values()) < len(mentee_ranks):
-                for key in mentor_capacity.keys():
-                    mentor_capacity[key] += 1
+            deficit = len(mentee_ranks) - sum(mentor_capacity.values())
+            if deficit > 0:
+                increment = -(-deficit // len(mentor_capacity))
+                mentor_capacity = {k: v + increment
+                                   for k, v in mentor_capacity.items()}
 
             return matching.MatchStatement(mentee_ranks,
                                            mentor_ranks,
                                            mentor_capacity)
 
-        for _ in range(2**10):
-            problem = generate_problem(30, 20)
-            matching.solve_from_poset_problem(problem)
-
+        # Player names are formatted once rather than per sampled ranking
+        mentees = [f"S{idx}" for idx in range(30)]
+        mentors = [f"M{idx}" for idx in range(20)]
+        rng = random.Random(0xC0FFEE)
+        problems = [generate_problem(mentees, mentors, rng)
+                    for _ in range(2**10)]
+        res = matching.solve_from_poset_problems(problems,
+                                                 seed=rng.getrandbits(32))
 
-class TestFromCSV(unittest.TestCase):
-    def test_bad_mentee_path(self):
-        data_dir = util.test_data_dir().joinpath('data/good_csv')
-        mentee_path = data_dir.joinpath('menteez_rankings.csv')
-        mentor_path = data_dir.joinpath('mentor_rankings.csv')
-        mentor_capacities_path = data_dir.joinpath('capacities.csv')
+        self.assertEqual(len(res), len(problems))
+        for problem, match in zip(problems, res):
+            assert sum(len(x) for x in match.values()) == \
+                len(problem.mentee_rankings)
 
-        with self.assertRaises(matching.InvalidProblemStatement):
-            matching.from_csv_files(mentee_path,
-                                    mentor_path,
-                                    mentor_capacities_path)
 
-    def test_bad_mentor_path(self):
-        data_dir = util.test_data_dir().joinpath('data/good_csv')
-        mentee_path = data_dir.joinpath('mentee_rankings.csv')
-        mentor_path = data_dir.joinpath('mentorz_rankings.csv')
-        mentor_capacities_path = data_dir.joinpath('capacities.csv')
-
-        with self.assertRaises(matching.InvalidProblemStatement):
-            matching.from_csv_files(mentee_path,
-                                    mentor_path,
-                                    mentor_capacities_path)
-
-    def test_bad_capacity_path(self):
-        data_dir = util.test_data_dir().joinpath('data/good_csv')
-        mentee_path = data_dir.joinpath('mentee_rankings.csv')
-        mentor_path = data_dir.joinpath('mentor_rankings.csv')
-        mentor_capacities_path = data_dir.joinpath('capacitiesz.csv')
-
-        with self.assertRaises(matching.InvalidProblemStatement):
-            matching.from_csv_files(mentee_path,
-                                    mentor_path,
-                                    mentor_capacities_path)
+class TestFromCSV(unittest.TestCase):
+    data_dir: pathlib.Path
+    good: Tuple[pathlib.Path, pathlib.Path, pathlib.Path]
+
+    @classmethod
+    def setUpClass(cls):
+        cls.data_dir = util.test_data_dir().joinpath('data/good_csv')
+        cls.good = (cls.data_dir.joinpath('mentee_rankings.csv'),
+                    cls.data_dir.joinpath('mentor_rankings.csv'),
+                    cls.data_dir.joinpath('capacities.csv'))
+
+    def test_bad_paths(self):
+        bad_files = [('menteez_rankings.csv', 'mentor_rankings.csv',
+                      'capacities.csv'),
+                     ('mentee_rankings.csv', 'mentorz_rankings.csv',
+                      'capacities.csv'),
+                     ('mentee_rankings.csv', 'mentor_rankings.csv',
+                      'capacitiesz.csv')]
+
+        for mentee_file, mentor_file, mentor_capacities_file in bad_files:
+            with self.subTest(files=(mentee_file,
+                                     mentor_file,
+                                     mentor_capacities_file)), \
+                    self.assertRaises(matching.InvalidProblemStatement):
+                matching.from_csv_files(
+                    self.data_dir.joinpath(mentee_file),
+                    self.data_dir.joinpath(mentor_file),
+                    self.data_dir.joinpath(mentor_capacities_file))
 
     def test_valid_ranking(self):
-        data_dir = util.test_data_dir().joinpath('data/good_csv')
-        mentee_path = data_dir.joinpath('mentee_rankings.csv')
-        mentor_path = data_dir.joinpath('mentor_rankings.csv')
-        mentor_capacities_path = data_dir.joinpath('capacities.csv')
-
-        res = matching.from_csv_files(mentee_path,
-                                      mentor_path,
-                                      mentor_capacities_path)
+        res = matching.from_csv_files(*self.good)
+        self.assertDictEqual(res.mentee_rankings, {'S1': ['M1', 'M2'],
+                                                   'S2': ['M1']})
+        self.assertDictEqual(res.mentor_rankings, {'M1': ['S1'], 'M2':
+                                                   ['S1', 'S2']})
+        self.assertDictEqual(res.mentor_capacities, {'M1': 1,
+                                                     'M2': 2})
+
+    def test_whitespace_stripped(self):
+        res = matching.from_csv_files(*util.match_inputs('data/padded_csv'))
         self.assertDictEqual(res.mentee_rankings, {'S1': ['M1', 'M2'],
                                                    'S2': ['M1']})
         self.assertDictEqual(res.mentor_rankings, {'M1': ['S1'], 'M2':
@@ -312,33 +309,139 @@ class TestPosetToOrdered(unittest.TestCase):
             'M3': ['S2', 'S1']
         }
         capacities = {'M1': 1, 'M2': 1, 'M3': 1}
+        problem = MatchStatement(mentee, mentor, capacities)
+        mentee_keys = mentee.keys()
+        mentor_keys = mentor.keys()
+        s_1_head = frozenset(('M1', 'M3'))
 
         for _ in range(2**10):
-            res = matching.poset_to_ordered(
-                MatchStatement(mentee, mentor, capacities))
+            res = matching.poset_to_ordered(problem)
 
-            self.assertDictEqual(res.mentor_capacities, capacities)
-            self.assertEqual(res.mentee_rankings.keys(), mentee.keys())
-            self.assertEqual(res.mentor_rankings.keys(), mentor.keys())
+            assert res.mentor_capacities == capacities
+            assert res.mentee_rankings.keys() == mentee_keys
+            assert res.mentor_rankings.keys() == mentor_keys
 
             for rankings in res.mentee_rankings.values():
-                self.assertEqual(len(set(rankings)), 3)
+                assert len(set(rankings)) == 3
 
             s_1 = res.mentee_rankings['S1']
-            self.assertEqual(set(s_1[:2]), set(['M1', 'M3']))
-            self.assertEqual(s_1[2], 'M2')
-            self.assertEqual(res.mentee_rankings['S2'], ['M2', 'M1', 'M3'])
-            self.assertEqual(res.mentee_rankings['S3'], ['M1', 'M3', 'M2'])
+            assert frozenset(s_1[:2]) == s_1_head
+            assert s_1[2] == 'M2'
+            assert res.mentee_rankings['S2'] == ['M2', 'M1', 'M3']
+            assert res.mentee_rankings['S3'] == ['M1', 'M3', 'M2']
 
             for rankings in res.mentor_rankings.values():
-                self.assertEqual(len(set(rankings)), 3)
-
-            self.assertEqual(res.mentor_rankings['M1'], ['S1', 'S2', 'S3'])
-            self.assertEqual(res.mentor_rankings['M2'], ['S3', 'S2', 'S1'])
-            self.assertEqual(res.mentor_rankings['M3'], ['S2', 'S1', 'S3'])
+                assert len(set(rankings)) == 3
 
+            assert res.mentor_rankings['M1'] == ['S1', 'S2', 'S3']
+            assert res.mentor_rankings['M2'] == ['S3', 'S2', 'S1']
+            assert res.mentor_rankings['M3'] == ['S2', 'S1', 'S3']
 
-class TestSolve(util.TestWithTempDirectory):
+    def test_seeded_expansion_is_reproducible(self):
+        mentee = {'S1': [], 'S2': [], 'S3': ['M1']}
+        mentor = {'M2': ['S3']}
+        capacities = {'M1': 1, 'M2': 1, 'M3': 1}
+        problem = MatchStatement(mentee, mentor, capacities)
+
+        res = matching.poset_to_ordered(problem, rng=random.Random(7))
+        for _ in range(2**4):
+            other = matching.poset_to_ordered(problem, rng=random.Random(7))
+            self.assertDictEqual(res.mentee_rankings, other.mentee_rankings)
+            self.assertDictEqual(res.mentor_rankings, other.mentor_rankings)
+
+    def test_seeded_batch_is_reproducible(self):
+        mentee = {'S1': [], 'S2': [], 'S3': ['M1'], 'S4': []}
+        mentor = {'M2': ['S3']}
+        capacities = {'M1': 1, 'M2': 2, 'M3': 1}
+        problems = [MatchStatement(mentee, mentor, capacities)
+                    for _ in range(2**4)]
+
+        res = matching.solve_from_poset_problems(problems, seed=7)
+        self.assertEqual(len(res), len(problems))
+        for _ in range(2**4):
+            other = matching.solve_from_poset_problems(problems, seed=7)
+            self.assertEqual(res, other)
+
+
+class TestNativeSolve(unittest.TestCase):
+    def assert_agrees_with_matching_library(self, mentee_rankings,
+                                            mentor_rankings, capacities):
+        # The library is fed only the mutually acceptable pairs, which is
+        # what _native_solve is expected to restrict itself to
+        mutual_mentees = {
+            mentee: [x for x in ranks if mentee in mentor_rankings.get(x, [])]
+            for mentee, ranks in mentee_rankings.items()}
+        mutual_mentors = {
+            mentor: [x for x in ranks if mentor in mentee_rankings.get(x, [])]
+            for mentor, ranks in mentor_rankings.items()}
+        game_mentees = {k: v for k, v in mutual_mentees.items() if v}
+        game_mentors = {k: v for k, v in mutual_mentors.items() if v}
+
+        for mentee_optimal in (True, False):
+            expected = {mentor: [] for mentor in capacities}
+            if game_mentees and game_mentors:
+                game = HospitalResident.create_from_dictionaries(
+                    game_mentees, game_mentors,
+                    {k: capacities[k] for k in game_mentors})
+                solution = game.solve(
+                    optimal='resident' if mentee_optimal else 'hospital')
+                expected.update({k.name: sorted(x.name for x in v)
+                                 for k, v in solution.items()})
+
+            # pylint: disable=protected-access
+            res = matching._native_solve(mentee_rankings,
+                                         mentor_rankings,
+                                         capacities,
+                                         mentee_optimal=mentee_optimal)
+            self.assertDictEqual({k: sorted(v) for k, v in res.items()},
+                                 expected)
+
+    def test_agrees_with_matching_library(self):
+        rng = random.Random(0xBEEF)
+        for _ in range(2**7):
+            mentees = [f"S{idx}" for idx in range(rng.randint(1, 30))]
+            mentors = [f"M{idx}" for idx in range(rng.randint(1, 20))]
+            mentee_rankings = {mentee: rng.sample(mentors, len(mentors))
+                               for mentee in mentees}
+            mentor_rankings = {mentor: rng.sample(mentees, len(mentees))
+                               for mentor in mentors}
+            capacities = {mentor: rng.randint(1, 5) for mentor in mentors}
+            self.assert_agrees_with_matching_library(mentee_rankings,
+                                                     mentor_rankings,
+                                                     capacities)
+
+    def test_agrees_with_matching_library_on_partial_rankings(self):
+        rng = random.Random(0xFACE)
+        for _ in range(2**8):
+            mentees = [f"S{idx}" for idx in range(rng.randint(1, 30))]
+            mentors = [f"M{idx}" for idx in range(rng.randint(1, 20))]
+            mentee_rankings = {
+                mentee: rng.sample(mentors, rng.randint(0, len(mentors)))
+                for mentee in mentees}
+            mentor_rankings = {
+                mentor: rng.sample(mentees, rng.randint(0, len(mentees)))
+                for mentor in rng.sample(mentors,
+                                         rng.randint(0, len(mentors)))}
+            capacities = {mentor: rng.randint(1, 5) for mentor in mentors}
+            self.assert_agrees_with_matching_library(mentee_rankings,
+                                                     mentor_rankings,
+                                                     capacities)
+
+    def test_only_mutually_ranked_pairs_match(self):
+        mentee_rankings = {'S1': ['M1', 'M2'], 'S2': ['M1'], 'S3': []}
+        mentor_rankings = {'M1': ['S2', 'S3'], 'M2': ['S2']}
+        capacities = {'M1': 1, 'M2': 2}
+
+        for mentee_optimal in (True, False):
+            # pylint: disable=protected-access
+            res = matching._native_solve(mentee_rankings,
+                                         mentor_rankings,
+                                         capacities,
+                                         mentee_optimal=mentee_optimal)
+            self.assertDictEqual(res, {'M1': ['S2'], 'M2': []})
+
+
+class TestSolve(util.TestWithTempOutput):
     def test_solve(self):
         mentee_path, mentor_path, mentor_capacities_path = \
             util.match_inputs('data/good_csv')
@@ -349,15 +452,15 @@ class TestSolve(util.TestWithTempDirectory):
                        mentor_capacities_path,
                        results_path)
 
-        with open(results_path, 'r') as results_file:
-            match = sorted(list(csv.reader(results_file)))
-            self.assertEqual(len(match), 2)
+        lines = sorted(results_path.read_text().splitlines())
+        match = [line.split(',') for line in lines]
+        self.assertEqual(len(match), 2)
 
-            self.assertEqual(len(match[0]), 2)
-            self.assertEqual(match[0][0], 'M1', 'S1')
+        self.assertEqual(len(match[0]), 2)
+        self.assertEqual(match[0][0], 'M1', 'S1')
 
-            self.assertEqual(len(match[1]), 2)
-            self.assertEqual(match[1][0], 'M2', 'S2')
+        self.assertEqual(len(match[1]), 2)
+        self.assertEqual(match[1][0], 'M2', 'S2')
 
 if __name__ == '__main__':
     unittest.main()  # pragma: no cover
@@ -1,14 +1,19 @@
 # pylint: disable=missing-docstring
 
+import functools
+import os
 import pathlib
 import tempfile
 import unittest
 
 from typing import Tuple
 
+_DATA_DIR = pathlib.Path(__file__).parent.absolute()
+
 def test_data_dir():
-    return pathlib.Path(__file__).parent.absolute()
+    return _DATA_DIR
 
+@functools.lru_cache(maxsize=None)
 def match_inputs(root_dir) -> Tuple[pathlib.Path, pathlib.Path, pathlib.Path]:
     data_dir = test_data_dir().joinpath(root_dir)
     mentee_path = data_dir.joinpath('mentee_rankings.csv')
@@ -16,14 +21,18 @@ def match_inputs(root_dir) -> Tuple[pathlib.Path, pathlib.Path, pathlib.Path]:
     mentor_capacities_path = data_dir.joinpath('capacities.csv')
     return mentee_path, mentor_path, mentor_capacities_path
 
-class TestWithTempDirectory(unittest.TestCase):
-    test_dir: tempfile.TemporaryDirectory
+class TestWithTempOutput(unittest.TestCase):
+    _out: str
 
     def setUp(self):
-        self.test_dir = tempfile.TemporaryDirectory()
+        # A single closed, undeleted temp file is all the tests need to write
+        # to, which avoids creating and removing a directory per test
+        with tempfile.NamedTemporaryFile(suffix='.csv',
+                                         delete=False) as out_file:
+            self._out = out_file.name
 
     def tearDown(self):
-        self.test_dir.cleanup()
+        os.unlink(self._out)
 
     def match_output(self) -> pathlib.Path:
-        return pathlib.Path(self.test_dir.name).joinpath('matching.csv')
+        return pathlib.Path(self._out)